@@ -1,13 +1,36 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context, g
 from flask_cors import CORS
 import os
 import requests
-import polyline
+import numpy as np
+import route_geometry
 import urllib.parse
-from pymongo import MongoClient
+import threading
+import json
+import unicodedata
+import hashlib
+import time
+import cProfile
+import pymongo
+import metrics
+from metrics import stage, observe_upstream
+from contextlib import contextmanager
+from resilience import (
+    CircuitBreaker, Deadline, DeadlineExceeded, current_deadline, upstream_timeout,
+    submit_in_context, map_in_context, is_provider_failure, is_database_failure
+)
+from werkzeug.exceptions import HTTPException
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from database import LazyMongo
+from cache import TTLCache, MongoCacheTier, SingleFlight
+from history import HistoryWriter
+from bson import ObjectId
+from bson.errors import InvalidId
 from dotenv import load_dotenv
-from requests.exceptions import RequestException
+from requests.exceptions import RequestException, Timeout
 from datetime import datetime
+from pymongo import DESCENDING
 
 # Constants for cost calculations
 CUSTO_AGUA_POR_PARADA = 4.0  # Cost of water per stop
@@ -28,14 +51,24 @@ load_dotenv(dotenv_path=".env", override=True)
 mongo_url = os.getenv("MONGO_URL")
 GASOLINE_PRICE = float(os.getenv("GASOLINE_PRICE", 6.0))  # Default R$6 per liter
 
-# Connect to MongoDB
-try:
-    client = MongoClient(mongo_url, serverSelectionTimeoutMS=10000)
-    client.server_info()
-    db = client["cidades"]
-    historico_collection = db["historico"]
-except Exception:
-    historico_collection = None  # Set to None if connection fails
+# Connect to MongoDB in the background (retrying until it answers), so the app
+# starts instantly and history comes back when the database does
+mongo = LazyMongo(
+    mongo_url,
+    "cidades",
+    timeout_ms=int(os.getenv("MONGO_TIMEOUT_MS", 3000)),
+    retry_interval=float(os.getenv("MONGO_RETRY_INTERVAL", 15))
+)
+
+@mongo.on_connect
+def create_indexes(db):
+    db["historico"].create_index([("data", DESCENDING), ("_id", DESCENDING)])
+
+mongo.start()
+
+# Opt-in profiling: dump a cProfile trace for requests slower than this (0 disables)
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 0))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
 
 # Set up Flask app
 app = Flask(__name__)
@@ -46,6 +79,231 @@ GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# API endpoints (overridable to point at local stand-ins, see benchmarks/)
+GOOGLE_DIRECTIONS_URL = os.getenv("GOOGLE_DIRECTIONS_URL", "https://maps.googleapis.com/maps/api/directions/json")
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "http://api.openweathermap.org/data/2.5/weather")
+GROQ_URL = os.getenv("GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
+
+# Shared HTTP session (keep-alive pool for Google, OpenWeather and Groq)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 20))
+
+http_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+http_session.mount("https://", _adapter)
+http_session.mount("http://", _adapter)
+
+# Max in-flight requests per upstream
+GOOGLE_MAX_INFLIGHT = int(os.getenv("GOOGLE_MAX_INFLIGHT", 10))
+OPENWEATHER_MAX_INFLIGHT = int(os.getenv("OPENWEATHER_MAX_INFLIGHT", 16))
+GROQ_MAX_INFLIGHT = int(os.getenv("GROQ_MAX_INFLIGHT", 4))
+UPSTREAM_LIMITS = {
+    "google": threading.BoundedSemaphore(GOOGLE_MAX_INFLIGHT),
+    "openweather": threading.BoundedSemaphore(OPENWEATHER_MAX_INFLIGHT),
+    "groq": threading.BoundedSemaphore(GROQ_MAX_INFLIGHT),
+}
+
+# Time budget for a whole request: later upstream timeouts shrink as earlier
+# stages use it up
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 25))
+BATCH_DEADLINE = float(os.getenv("BATCH_DEADLINE", 90))
+
+# Circuit breakers: fail fast while a provider is down, probe it again later
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", 30))
+BREAKERS = {
+    name: CircuitBreaker(name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET)
+    for name in UPSTREAM_LIMITS
+}
+
+# One call to an external API: circuit breaker, request deadline, in-flight
+# limit and metrics. Yields the timeout to use for the call.
+@contextmanager
+def upstream_call(name, max_timeout):
+    breaker = BREAKERS[name]
+    try:
+        timeout = upstream_timeout(max_timeout)
+        breaker.before_call()
+    except Exception as e:
+        metrics.upstream_errors.inc(
+            upstream=name, tipo="prazo_esgotado" if isinstance(e, DeadlineExceeded) else "circuito_aberto"
+        )
+        raise
+
+    if not UPSTREAM_LIMITS[name].acquire(timeout=timeout):
+        breaker.cancel()
+        metrics.upstream_errors.inc(upstream=name, tipo="prazo_esgotado")
+        raise DeadlineExceeded(f"Sem vaga para chamar {name} dentro do prazo")
+    try:
+        # Waiting for a slot used part of the budget
+        timeout = upstream_timeout(max_timeout)
+    except DeadlineExceeded:
+        UPSTREAM_LIMITS[name].release()
+        breaker.cancel()
+        metrics.upstream_errors.inc(upstream=name, tipo="prazo_esgotado")
+        raise
+
+    try:
+        with observe_upstream(name):
+            yield timeout
+        breaker.record_success()
+    except Exception as e:
+        if not is_provider_failure(e):
+            breaker.record_success()
+        elif isinstance(e, DeadlineExceeded) or (isinstance(e, Timeout) and timeout < max_timeout):
+            # The request's deadline made the call short, not the provider slow
+            breaker.cancel()
+        else:
+            breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.cancel()  # e.g. the client went away mid-stream
+        raise
+    finally:
+        UPSTREAM_LIMITS[name].release()
+
+# MongoDB has a breaker too: while it is down, history writes and the shared
+# cache tiers fail fast instead of each waiting for a server selection timeout
+BREAKERS["mongodb"] = CircuitBreaker("mongodb", failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET)
+MONGO_CACHE_TIMEOUT = float(os.getenv("MONGO_CACHE_TIMEOUT", 0.3))  # Shared cache tier reads and writes
+MONGO_WRITE_TIMEOUT = float(os.getenv("MONGO_WRITE_TIMEOUT", 5))  # History batch inserts
+
+# One MongoDB operation: circuit breaker, a timeout capped by the request
+# deadline (pymongo.timeout covers server selection too) and metrics
+@contextmanager
+def mongo_call(max_timeout):
+    breaker = BREAKERS["mongodb"]
+    try:
+        timeout = upstream_timeout(max_timeout)
+        breaker.before_call()
+    except Exception as e:
+        metrics.upstream_errors.inc(
+            upstream="mongodb", tipo="prazo_esgotado" if isinstance(e, DeadlineExceeded) else "circuito_aberto"
+        )
+        raise
+
+    try:
+        with observe_upstream("mongodb"), pymongo.timeout(timeout):
+            yield
+        breaker.record_success()
+    except Exception as e:
+        if not is_database_failure(e):
+            breaker.record_success()
+        elif e.timeout and timeout < max_timeout:
+            breaker.cancel()  # Cut short by the request's deadline
+        else:
+            breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.cancel()
+        raise
+
+# The shared cache tiers sit on the request path, so they get their own client
+# with short timeouts, separate from the one used for history
+cache_mongo = LazyMongo(
+    mongo_url,
+    "cidades",
+    timeout_ms=int(os.getenv("MONGO_CACHE_TIMEOUT_MS", 1000)),
+    socket_timeout_ms=int(os.getenv("MONGO_CACHE_TIMEOUT_MS", 1000)),
+    retry_interval=float(os.getenv("MONGO_RETRY_INTERVAL", 15))
+)
+
+# Collections of the shared cache tiers (see MongoCacheTier)
+CACHE_COLLECTIONS = ("weather_cache", "guia_cache", "route_cache")
+
+@cache_mongo.on_connect
+def create_cache_indexes(db):
+    for name in CACHE_COLLECTIONS:
+        MongoCacheTier.ensure_index(db[name])
+
+cache_mongo.start()
+
+def shared_cache_tier(name):
+    return MongoCacheTier(lambda: cache_mongo.collection(name), guard=lambda: mongo_call(MONGO_CACHE_TIMEOUT))
+
+# History is written in the background, in batches
+HISTORY_QUEUE_SIZE = int(os.getenv("HISTORY_QUEUE_SIZE", 10000))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", 200))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 2.0))
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+history_writer = HistoryWriter(
+    lambda: mongo.collection("historico"),
+    max_queue=HISTORY_QUEUE_SIZE,
+    batch_size=HISTORY_BATCH_SIZE,
+    interval=HISTORY_FLUSH_INTERVAL,
+    guard=lambda: mongo_call(MONGO_WRITE_TIMEOUT)
+)
+history_writer.start()
+
+# Thread pool used to fetch weather for the waypoints in parallel. Sized to the
+# OpenWeather in-flight limit so the semaphore, not the pool, caps concurrency.
+WEATHER_WORKERS = int(os.getenv("WEATHER_WORKERS", OPENWEATHER_MAX_INFLIGHT))
+weather_executor = ThreadPoolExecutor(max_workers=WEATHER_WORKERS, thread_name_prefix="weather")
+
+# Batch trip planning. Batches call each upstream from their own small pool,
+# sized below its in-flight limit, so a large batch holds only a slice of the
+# slots and never queues ahead of interactive requests
+BATCH_MAX_TRIPS = int(os.getenv("BATCH_MAX_TRIPS", 50))
+BATCH_ROUTE_WORKERS = int(os.getenv("BATCH_ROUTE_WORKERS", max(1, GOOGLE_MAX_INFLIGHT // 2)))
+BATCH_WEATHER_WORKERS = int(os.getenv("BATCH_WEATHER_WORKERS", max(1, OPENWEATHER_MAX_INFLIGHT // 4)))
+BATCH_LLM_WORKERS = int(os.getenv("BATCH_LLM_WORKERS", max(1, GROQ_MAX_INFLIGHT // 2)))
+batch_route_executor = ThreadPoolExecutor(max_workers=BATCH_ROUTE_WORKERS, thread_name_prefix="batch-route")
+batch_weather_executor = ThreadPoolExecutor(max_workers=BATCH_WEATHER_WORKERS, thread_name_prefix="batch-weather")
+batch_llm_executor = ThreadPoolExecutor(max_workers=BATCH_LLM_WORKERS, thread_name_prefix="batch-llm")
+
+# Weather cache: coordinates snapped to a grid cell (degrees), TTL matched to
+# OpenWeather's ~10 min observation updates
+WEATHER_GRID_DEG = float(os.getenv("WEATHER_GRID_DEG", 0.1))  # ~11 km
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", 600))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", 5000))
+WEATHER_CACHE_SHARED = os.getenv("WEATHER_CACHE_SHARED", "1") == "1"
+
+weather_cache = TTLCache(
+    maxsize=WEATHER_CACHE_SIZE,
+    ttl=WEATHER_CACHE_TTL,
+    shared=shared_cache_tier("weather_cache") if WEATHER_CACHE_SHARED else None
+)
+
+# Guide cache: Groq completions keyed by a coarse fingerprint of the prompt,
+# with concurrent identical requests coalesced into one call
+GUIDE_CACHE_TTL = int(os.getenv("GUIDE_CACHE_TTL", 12 * 3600))
+GUIDE_CACHE_SIZE = int(os.getenv("GUIDE_CACHE_SIZE", 1000))
+GUIDE_CACHE_SHARED = os.getenv("GUIDE_CACHE_SHARED", "1") == "1"
+GUIDE_TEMP_BUCKET = float(os.getenv("GUIDE_TEMP_BUCKET", 5))  # °C
+GUIDE_COST_BUCKET = float(os.getenv("GUIDE_COST_BUCKET", 50))  # R$
+
+guide_cache = TTLCache(
+    maxsize=GUIDE_CACHE_SIZE,
+    ttl=GUIDE_CACHE_TTL,
+    shared=shared_cache_tier("guia_cache") if GUIDE_CACHE_SHARED else None
+)
+guide_flight = SingleFlight()
+
+# Waypoint sampling along the route
+WAYPOINT_MODE = os.getenv("WAYPOINT_MODE", "distancia")  # "distancia" or "eta"
+WAYPOINT_SPACING_KM = float(os.getenv("WAYPOINT_SPACING_KM", 50))
+WAYPOINT_INTERVAL_MIN = float(os.getenv("WAYPOINT_INTERVAL_MIN", 40))
+
+# Route cache: Directions response plus decoded coordinates and waypoints
+ROUTE_LANGUAGE = "pt-BR"
+ROUTE_REGION = "br"
+ROUTE_CACHE_TTL = int(os.getenv("ROUTE_CACHE_TTL", 6 * 3600))
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", 500))
+ROUTE_CACHE_MAX_BYTES = int(os.getenv("ROUTE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+ROUTE_CACHE_SHARED = os.getenv("ROUTE_CACHE_SHARED", "1") == "1"
+
+def _route_entry_size(entry):
+    return len(json.dumps(entry))
+
+route_cache = TTLCache(
+    maxsize=ROUTE_CACHE_SIZE,
+    ttl=ROUTE_CACHE_TTL,
+    maxbytes=ROUTE_CACHE_MAX_BYTES,
+    sizeof=_route_entry_size,
+    shared=shared_cache_tier("route_cache") if ROUTE_CACHE_SHARED else None
+)
+
 # Calculate trip costs (fuel, water, food)
 def calcular_gastos(route_info, weather_reports, veiculo):
     if not route_info.get('legs'):
@@ -79,19 +337,24 @@ def calcular_gastos(route_info, weather_reports, veiculo):
         "total": round(custo_gasolina + custo_agua + custo_comida, 2)
     }
 
+# Calculate costs for many trips at once: (route_info, weather_reports, veiculo) tuples
+def calcular_gastos_lote(viagens):
+    return [calcular_gastos(route_info, weather_reports, veiculo) for route_info, weather_reports, veiculo in viagens]
+
 # Get route from Google Maps API
 def get_route(origin, destination):
-    url = "https://maps.googleapis.com/maps/api/directions/json"
+    url = GOOGLE_DIRECTIONS_URL
     params = {
         'origin': origin,
         'destination': destination,
         'key': GOOGLE_MAPS_API_KEY,
-        'language': 'pt-BR',
-        'region': 'br'
+        'language': ROUTE_LANGUAGE,
+        'region': ROUTE_REGION
     }
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
+        with upstream_call("google", 10) as timeout:
+            response = http_session.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
         data = response.json()
         if data.get('status') != 'OK':
             return None
@@ -99,23 +362,89 @@ def get_route(origin, destination):
     except RequestException:
         return None
 
-# Extract coordinates from route for weather checks
+# Extract coordinates from route for weather checks, as an (n, 2) array
 def extract_route_coordinates(route):
-    coordinates = []
-    for leg in route.get('legs', []):
-        for step in leg.get('steps', []):
-            polyline_str = step['polyline']['points']
-            coordinates.extend(polyline.decode(polyline_str))
+    coordinates, _ = route_geometry.decode_route(route)
     return coordinates
 
-# Select key points along the route
-def select_waypoints(coordinates, max_points=15):
-    step = max(1, len(coordinates) // max_points)
-    return coordinates[::step]
+# Normalize a place name for cache keys (case, accents, extra spaces)
+def normalize_place(name):
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return " ".join(name.lower().replace(",", " ").split())
+
+def route_cache_key(origin, destination):
+    return "|".join([normalize_place(origin), normalize_place(destination), ROUTE_LANGUAGE, ROUTE_REGION])
+
+# Keep only what the request path reads: the overview polyline (map) and the
+# legs' addresses, distance and duration (summary, costs). Step polylines are
+# dropped, so cached entries stay small and hits skip re-parsing them.
+def trim_route(route):
+    return {
+        "overview_polyline": route.get('overview_polyline', {}),
+        "legs": [
+            {field: leg[field] for field in ("start_address", "end_address", "distance", "duration") if field in leg}
+            for leg in route.get('legs', [])
+        ],
+    }
+
+# Get the trimmed route and its waypoints, using the route cache
+def get_route_entry(origin, destination):
+    key = route_cache_key(origin, destination)
+    with stage("route_cache"):
+        entry = route_cache.get(key)
+    if entry is None:
+        with stage("route"):
+            route = get_route(origin, destination)
+        if not route:
+            return None
+        with stage("decode"):
+            coordinates, eta = route_geometry.decode_route(route)
+        with stage("sampling"):
+            waypoints = select_waypoints(coordinates, eta=eta)
+        entry = {
+            "rota": trim_route(route),
+            "waypoints": [list(point) for point in waypoints],
+        }
+        with stage("route_cache"):
+            route_cache.set(key, entry)
+    return {
+        "route": entry["rota"],
+        "waypoints": [tuple(point) for point in entry["waypoints"]],
+    }
+
+# Select key points along the route, spaced by distance (or by driving time
+# when WAYPOINT_MODE is "eta"), one per weather cell
+def select_waypoints(coordinates, max_points=15, eta=None):
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if WAYPOINT_MODE == "eta" and eta is not None and len(eta) and eta[-1] > 0:
+        points = route_geometry.sample_by_eta(coordinates, eta, WAYPOINT_INTERVAL_MIN * 60, max_points)
+    else:
+        points = route_geometry.sample_by_distance(coordinates, WAYPOINT_SPACING_KM, max_points)
+    points = route_geometry.dedupe_cells(points, WEATHER_GRID_DEG)
+    return [(float(lat), float(lon)) for lat, lon in points]
 
-# Get weather for a specific location
+# Snap coordinates to the center of their weather grid cell
+def weather_cell(lat, lon):
+    row, col = (int(value) for value in route_geometry.grid_cells((lat, lon), WEATHER_GRID_DEG)[0])
+    center = (
+        round(-90 + (row + 0.5) * WEATHER_GRID_DEG, 4),
+        round(-180 + (col + 0.5) * WEATHER_GRID_DEG, 4)
+    )
+    return f"{WEATHER_GRID_DEG}:{row}:{col}", center
+
+# Get weather for a location, served from the grid-cell cache when possible
 def get_weather(lat, lon):
-    url = "http://api.openweathermap.org/data/2.5/weather"
+    key, (cell_lat, cell_lon) = weather_cell(lat, lon)
+    report = weather_cache.get(key)
+    if report is None:
+        report = fetch_weather(cell_lat, cell_lon)
+        if report:
+            weather_cache.set(key, report)
+    return report
+
+# Get weather for a specific location from OpenWeather
+def fetch_weather(lat, lon):
+    url = OPENWEATHER_URL
     params = {
         'lat': lat,
         'lon': lon,
@@ -124,8 +453,9 @@ def get_weather(lat, lon):
         'lang': 'pt'
     }
     try:
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
+        with upstream_call("openweather", 5) as timeout:
+            response = http_session.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
         data = response.json()
         if data.get("cod") != 200 or not data.get("weather"):
             return None
@@ -137,11 +467,22 @@ def get_weather(lat, lon):
     except RequestException:
         return None
 
-# Create a detailed travel summary
-def generate_travel_summary(route_info, weather_reports, veiculo, destination, gastos=None):
-    if not route_info.get('legs'):
-        return "Não foi possível gerar o resumo: dados da rota incompletos."
+# Get weather for all waypoints in parallel, keeping route order
+def get_weather_many(waypoints):
+    reports = map_in_context(weather_executor, lambda point: get_weather(*point), waypoints)
+    return [report for report in reports if report]
 
+# Yield (index, report) for each waypoint as soon as its weather arrives
+def iter_weather(waypoints):
+    futures = {
+        submit_in_context(weather_executor, get_weather, lat, lon): index
+        for index, (lat, lon) in enumerate(waypoints)
+    }
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+# Technical summary (route, weather, costs) used as the guide's input
+def build_base_summary(route_info, weather_reports, veiculo, gastos=None):
     leg = route_info['legs'][0]
     base_summary = (
         f"## Resumo da Viagem ##\n"
@@ -167,8 +508,10 @@ def generate_travel_summary(route_info, weather_reports, veiculo, destination, g
             f"- Comida: R$ {gastos['comida']:.2f}\n"
             f"**Total estimado:** R$ {gastos['total']:.2f}\n"
         )
+    return base_summary
 
-    # Ask Groq API for a personalized guide
+# Groq chat-completions payload for the personalized guide
+def build_guide_payload(base_summary, veiculo, destination, stream=False):
     prompt = (
         f"Você é um assistente de viagem especializado em criar guias detalhados, personalizados e acolhedores em português. "
         f"Transforme os dados técnicos abaixo em um guia de viagem completo para o destino '{destination}'. "
@@ -183,7 +526,6 @@ def generate_travel_summary(route_info, weather_reports, veiculo, destination, g
         f"Dados técnicos:\n{base_summary}"
     )
 
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
     payload = {
         "model": "llama3-70b-8192",
         "messages": [{
@@ -195,27 +537,211 @@ def generate_travel_summary(route_info, weather_reports, veiculo, destination, g
         }],
         "temperature": 0.5
     }
+    if stream:
+        payload["stream"] = True
+    return payload
 
-    try:
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
+# Fingerprint of everything the guide prompt depends on, with temperatures
+# and costs rounded to buckets so near-identical trips share a completion
+def guide_fingerprint(route_info, weather_reports, veiculo, destination, gastos=None):
+    leg = route_info['legs'][0]
+    clima = [
+        (normalize_place(w['city']), w['description'].lower(), int(w['temperature'] // GUIDE_TEMP_BUCKET))
+        for w in weather_reports
+    ]
+    custo = int(gastos['total'] // GUIDE_COST_BUCKET) if gastos and 'total' in gastos else None
+    key = json.dumps([
+        normalize_place(destination),
+        normalize_place(leg['start_address']),
+        normalize_place(leg['end_address']),
+        leg['distance']['text'],
+        veiculo.lower(),
+        clima,
+        custo,
+    ])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+# Call Groq (non-streaming) and return the guide text
+def request_guide(payload):
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+    with upstream_call("groq", 15) as timeout:
+        response = http_session.post(
+            GROQ_URL,
             headers=headers,
             json=payload,
-            timeout=15
+            timeout=timeout
         )
         response.raise_for_status()
-        return response.json()['choices'][0]['message']['content']
+    return response.json()['choices'][0]['message']['content']
+
+# Get the guide from the cache, or from a single (possibly shared) Groq call
+def get_guide(key, payload):
+    guide = guide_cache.get(key)
+    if guide is None:
+        def fetch():
+            result = request_guide(payload)
+            guide_cache.set(key, result)
+            return result
+        guide = guide_flight.do(key, fetch, timeout=upstream_timeout(20))
+    return guide
+
+# General tips used when the Groq API fails
+def build_fallback_tips(destination):
+    return (
+        f"## Dicas para sua Viagem ##\n"
+        f"Não conseguimos gerar um guia completo, mas aqui vão algumas dicas gerais:\n"
+        f"- Pesquise pontos turísticos em {destination} para aproveitar ao máximo.\n"
+        f"- Evite áreas desconhecidas à noite e mantenha seus pertences seguros.\n"
+        f"- Verifique os preços locais, pois algumas cidades turísticas podem ser mais caras.\n"
+    )
+
+# Fallback guide used when the Groq API fails
+def build_fallback_summary(base_summary, destination):
+    return f"{base_summary}\n\n{build_fallback_tips(destination)}"
+
+# Create a detailed travel summary
+def generate_travel_summary(route_info, weather_reports, veiculo, destination, gastos=None):
+    if not route_info.get('legs'):
+        return "Não foi possível gerar o resumo: dados da rota incompletos."
+
+    base_summary = build_base_summary(route_info, weather_reports, veiculo, gastos)
+
+    # Ask Groq API for a personalized guide
+    key = guide_fingerprint(route_info, weather_reports, veiculo, destination, gastos)
+    payload = build_guide_payload(base_summary, veiculo, destination)
+
+    try:
+        return get_guide(key, payload)
     except Exception as e:
         # Fallback if Groq API fails
-        fallback_summary = (
-            f"{base_summary}\n\n"
-            f"## Dicas para sua Viagem ##\n"
-            f"Não conseguimos gerar um guia completo, mas aqui vão algumas dicas gerais:\n"
-            f"- Pesquise pontos turísticos em {destination} para aproveitar ao máximo.\n"
-            f"- Evite áreas desconhecidas à noite e mantenha seus pertences seguros.\n"
-            f"- Verifique os preços locais, pois algumas cidades turísticas podem ser mais caras.\n"
-        )
-        return fallback_summary
+        return build_fallback_summary(base_summary, destination)
+
+# Same as generate_travel_summary, but yields the guide in pieces as Groq
+# streams its tokens
+def stream_travel_summary(route_info, weather_reports, veiculo, destination, gastos=None):
+    if not route_info.get('legs'):
+        yield "Não foi possível gerar o resumo: dados da rota incompletos."
+        return
+
+    base_summary = build_base_summary(route_info, weather_reports, veiculo, gastos)
+    key = guide_fingerprint(route_info, weather_reports, veiculo, destination, gastos)
+
+    cached = guide_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    # Someone is already generating this guide: wait for it instead
+    leader, call = guide_flight.begin(key)
+    if not leader:
+        try:
+            yield call.wait(timeout=upstream_timeout(20))
+        except Exception:
+            yield build_fallback_summary(base_summary, destination)
+        return
+
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+    payload = build_guide_payload(base_summary, veiculo, destination, stream=True)
+
+    tokens = []
+    deadline = current_deadline.get()
+    try:
+        with upstream_call("groq", 15) as timeout:
+            with http_session.post(GROQ_URL, headers=headers, json=payload, timeout=timeout, stream=True) as response:
+                response.raise_for_status()
+                # Server-sent events: "data: {...}" lines, ending with "data: [DONE]"
+                for line in response.iter_lines(decode_unicode=True):
+                    # The read timeout applies per line, so a slow stream is
+                    # cut here when the request's budget runs out
+                    if deadline is not None and deadline.remaining() <= 0:
+                        raise DeadlineExceeded("Prazo da requisição esgotado durante o guia")
+                    if not line or not line.startswith("data: "):
+                        continue
+                    data = line[len("data: "):]
+                    if data == "[DONE]":
+                        break
+                    token = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                    if token:
+                        tokens.append(token)
+                        yield token
+        guide = "".join(tokens)
+        guide_cache.set(key, guide)
+        guide_flight.finish(key, result=guide)
+    except Exception as e:
+        guide_flight.finish(key, error=e)
+        if not tokens:
+            yield build_fallback_summary(base_summary, destination)
+        else:
+            # Part of the guide was already sent: close it with the general tips
+            yield "\n\n" + build_fallback_tips(destination)
+    finally:
+        # The client may disconnect mid-stream; never leave followers waiting
+        if not call.done.is_set():
+            guide_flight.finish(key, error=RuntimeError("Geração do guia interrompida"))
+
+# Queue trip for the background history writer
+def save_trip(origin, destination, veiculo):
+    save_trips([(origin, destination, veiculo)])
+
+# Queue many trips at once: (origin, destination, veiculo) tuples
+def save_trips(trips):
+    now = datetime.now()
+    for origin, destination, veiculo in trips:
+        history_writer.put({
+            "origem": origin,
+            "destino": destination,
+            "veiculo": veiculo,
+            "data": now,
+            # Normalized names, so /historico/estatisticas counts "A" and " a" as one route
+            "origem_normalizada": normalize_place(origin),
+            "destino_normalizado": normalize_place(destination),
+        })
+
+# Start request timer (and the profiler, when enabled)
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    budget = BATCH_DEADLINE if request.endpoint == "plan_viagem_batch" else REQUEST_DEADLINE
+    current_deadline.set(Deadline(budget))
+    if PROFILE_SLOW_MS > 0:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g.profiler = profiler
+        except ValueError:
+            pass  # Another request is already being profiled
+
+# Record request latency, add Server-Timing and dump slow profiles. Streamed
+# responses only finish when the body has been sent, so for those this
+# happens when the response is closed and the stage timings go out as a
+# final "tempos" event instead of the header.
+@app.after_request
+def finish_request_timer(response):
+    start = g.get("request_start")
+    if start is None:
+        return response
+    endpoint = request.endpoint or "desconhecido"
+    profiler = g.pop("profiler", None)
+
+    def finish():
+        elapsed = time.perf_counter() - start
+        metrics.request_seconds.observe(elapsed, endpoint=endpoint)
+        if profiler is not None:
+            profiler.disable()
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                filename = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{endpoint}.prof"
+                profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+        return elapsed
+
+    if response.is_streamed:
+        response.call_on_close(finish)
+        return response
+
+    elapsed = finish()
+    timing = metrics.server_timing_header()
+    response.headers["Server-Timing"] = (timing + ", " if timing else "") + f"total;dur={elapsed * 1000:.1f}"
+    return response
 
 # Serve the main page
 @app.route('/')
@@ -233,28 +759,23 @@ def plan_viagem():
     if not origin or not destination:
         return jsonify({"error": "Parâmetros 'origem' e 'destino' são obrigatórios"}), 400
     
-    route = get_route(origin, destination)
-    if not route:
+    route_entry = get_route_entry(origin, destination)
+    if not route_entry:
         return jsonify({"error": "Não foi possível calcular a rota"}), 400
     
-    coordinates = extract_route_coordinates(route)
-    waypoints = select_waypoints(coordinates)
+    route = route_entry["route"]
+    waypoints = route_entry["waypoints"]
     
-    weather_reports = [report for report in (get_weather(lat, lon) for lat, lon in waypoints) if report]
-    gastos = calcular_gastos(route, weather_reports, veiculo)
-    summary = generate_travel_summary(route, weather_reports, veiculo, destination, gastos)
+    with stage("weather") as info:
+        info["count"] = len(waypoints)
+        weather_reports = get_weather_many(waypoints)
+    with stage("cost"):
+        gastos = calcular_gastos(route, weather_reports, veiculo)
+    with stage("llm"):
+        summary = generate_travel_summary(route, weather_reports, veiculo, destination, gastos)
 
-    # Save trip to MongoDB
-    if historico_collection is not None:
-        try:
-            historico_collection.insert_one({
-                "origem": origin,
-                "destino": destination,
-                "veiculo": veiculo,
-                "data": datetime.now()
-            })
-        except Exception as e:
-            return jsonify({"error": f"Erro ao salvar no banco de dados: {str(e)}"}), 500
+    with stage("persistence"):
+        save_trip(origin, destination, veiculo)
     
     response = {
         "polyline": route.get('overview_polyline', {}).get('points', ''),
@@ -265,27 +786,296 @@ def plan_viagem():
     }
     return jsonify(response)
 
-# Show trip history
+# One line of the NDJSON streaming endpoints: {"tipo": ..., **fields}
+def stream_event(tipo, **fields):
+    return json.dumps({"tipo": tipo, **fields}, ensure_ascii=False) + "\n"
+
+# Streaming version of /plan_viagem (NDJSON, one event per line): the route
+# first, then each weather report as it arrives, the costs and the guide tokens
+@app.route('/plan_viagem/stream', methods=['POST'])
+def plan_viagem_stream():
+    data = request.get_json()
+    origin = data.get('origem')
+    destination = data.get('destino')
+    veiculo = data.get('veiculo', 'carro')
+
+    if not origin or not destination:
+        return jsonify({"error": "Parâmetros 'origem' e 'destino' são obrigatórios"}), 400
+
+    route_entry = get_route_entry(origin, destination)
+    if not route_entry:
+        return jsonify({"error": "Não foi possível calcular a rota"}), 400
+
+    route = route_entry["route"]
+    waypoints = route_entry["waypoints"]
+
+    def generate():
+        try:
+            yield stream_event(
+                "rota",
+                polyline=route.get('overview_polyline', {}).get('points', ''),
+                origin=origin,
+                destination=destination,
+                veiculo=veiculo,
+                paradas=len(waypoints)
+            )
+
+            reports = [None] * len(waypoints)
+            with stage("weather") as info:
+                info["count"] = len(waypoints)
+                for index, report in iter_weather(waypoints):
+                    reports[index] = report
+                    if report:
+                        yield stream_event("clima", indice=index, clima=report)
+            weather_reports = [report for report in reports if report]
+
+            with stage("cost"):
+                gastos = calcular_gastos(route, weather_reports, veiculo)
+            yield stream_event("gastos", gastos=gastos)
+
+            with stage("llm"):
+                for token in stream_travel_summary(route, weather_reports, veiculo, destination, gastos):
+                    yield stream_event("guia", texto=token)
+
+            with stage("persistence"):
+                save_trip(origin, destination, veiculo)
+            yield stream_event("tempos", **metrics.timings_summary(g.request_start))
+            yield stream_event("fim")
+        except Exception as e:
+            # The status line is already sent: report the error as the last event
+            record_error(e)
+            yield stream_event("erro", error=f"Erro interno do servidor: {str(e)}")
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# Plan many trips at once. Identical legs are fetched once, waypoints from all
+# trips are merged by weather cell, and each trip is streamed back (NDJSON)
+# as soon as its guide is ready
+@app.route('/plan_viagem/batch', methods=['POST'])
+def plan_viagem_batch():
+    data = request.get_json()
+    viagens = data.get('viagens') if isinstance(data, dict) else None
+
+    if not isinstance(viagens, list) or not viagens:
+        return jsonify({"error": "Parâmetro 'viagens' deve ser uma lista não vazia"}), 400
+    if len(viagens) > BATCH_MAX_TRIPS:
+        return jsonify({"error": f"Máximo de {BATCH_MAX_TRIPS} viagens por lote"}), 400
+
+    trips = []
+    for index, viagem in enumerate(viagens):
+        if not isinstance(viagem, dict) or not viagem.get('origem') or not viagem.get('destino'):
+            return jsonify({"error": f"Viagem {index}: parâmetros 'origem' e 'destino' são obrigatórios"}), 400
+        trips.append((viagem['origem'], viagem['destino'], viagem.get('veiculo', 'carro')))
+
+    def generate():
+        try:
+            # Unique legs, fetched in parallel
+            legs = {}
+            for origin, destination, _ in trips:
+                legs.setdefault(route_cache_key(origin, destination), (origin, destination))
+            with stage("batch_route") as info:
+                info["count"] = len(legs)
+                entries = dict(zip(legs, map_in_context(batch_route_executor, lambda leg: get_route_entry(*leg), legs.values())))
+
+            # Unique weather cells across every trip, fetched in parallel
+            cells = {}
+            for entry in entries.values():
+                for lat, lon in (entry["waypoints"] if entry else []):
+                    cells.setdefault(weather_cell(lat, lon)[0], (lat, lon))
+            with stage("batch_weather") as info:
+                info["count"] = len(cells)
+                reports = dict(zip(cells, map_in_context(batch_weather_executor, lambda point: get_weather(*point), cells.values())))
+
+            planned = []
+            for index, (origin, destination, veiculo) in enumerate(trips):
+                entry = entries[route_cache_key(origin, destination)]
+                if not entry:
+                    yield stream_event("viagem", indice=index, origin=origin, destination=destination,
+                                error="Não foi possível calcular a rota")
+                    continue
+                weather_reports = [
+                    reports[key] for key in (weather_cell(lat, lon)[0] for lat, lon in entry["waypoints"])
+                    if reports.get(key)
+                ]
+                planned.append((index, origin, destination, veiculo, entry["route"], weather_reports))
+
+            with stage("batch_cost"):
+                gastos_list = calcular_gastos_lote([(route, weather, veiculo) for _, _, _, veiculo, route, weather in planned])
+
+            with stage("batch_llm") as info:
+                info["count"] = len(planned)
+                futures = {}
+                for trip, gastos in zip(planned, gastos_list):
+                    _, _, destination, veiculo, route, weather_reports = trip
+                    future = submit_in_context(
+                        batch_llm_executor, generate_travel_summary, route, weather_reports, veiculo, destination, gastos
+                    )
+                    futures[future] = (trip, gastos)
+                for future in as_completed(futures):
+                    (index, origin, destination, veiculo, route, _), gastos = futures[future]
+                    yield stream_event(
+                        "viagem",
+                        indice=index,
+                        polyline=route.get('overview_polyline', {}).get('points', ''),
+                        summary=future.result(),
+                        gastos=gastos,
+                        origin=origin,
+                        destination=destination,
+                        veiculo=veiculo
+                    )
+
+            with stage("batch_persistence"):
+                save_trips([(origin, destination, veiculo) for _, origin, destination, veiculo, _, _ in planned])
+            yield stream_event("tempos", **metrics.timings_summary(g.request_start))
+            yield stream_event("fim", total=len(trips), rotas_unicas=len(legs), celulas_clima=len(cells))
+        except Exception as e:
+            # The status line is already sent: report the error as the last event
+            record_error(e)
+            yield stream_event("erro", error=f"Erro interno do servidor: {str(e)}")
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# Keyset pagination cursor: "<data ISO>_<_id>" of the last record of a page
+def encode_history_cursor(doc):
+    return f"{doc['data'].isoformat()}_{doc['_id']}"
+
+def decode_history_cursor(cursor):
+    data, _id = cursor.rsplit("_", 1)
+    try:
+        return datetime.fromisoformat(data), ObjectId(_id)
+    except InvalidId as e:
+        raise ValueError(str(e)) from e
+
+# Show trip history, newest first, one page at a time (?limite=&cursor=)
 @app.route('/historico', methods=['GET'])
 def mostrar_historico():
+    historico_collection = mongo.collection("historico")
     if historico_collection is None:
         return jsonify({"error": "Não foi possível conectar ao banco de dados MongoDB"}), 500
+
     try:
-        registros = list(
-            historico_collection.find({}, {"_id": 0, "origem": 1, "destino": 1, "data": 1}).sort("data", -1)
-        )
-        return jsonify(registros)
+        limite = min(max(int(request.args.get('limite', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        filtro = {}
+        if request.args.get('cursor'):
+            data, _id = decode_history_cursor(request.args['cursor'])
+            filtro = {"$or": [{"data": {"$lt": data}}, {"data": data, "_id": {"$lt": _id}}]}
+    except (ValueError, TypeError):
+        return jsonify({"error": "Parâmetros 'limite' ou 'cursor' inválidos"}), 400
+
+    try:
+        registros = historico_collection.find(
+            filtro, {"origem": 1, "destino": 1, "veiculo": 1, "data": 1}
+        ).sort([("data", DESCENDING), ("_id", DESCENDING)]).limit(limite)
+        first = next(registros, None)
+    except Exception as e:
+        return jsonify({"error": f"Erro ao acessar o histórico: {str(e)}"}), 500
+
+    # Stream the page: {"registros": [...], "proximo": cursor or null}
+    def generate():
+        yield '{"registros": ['
+        last, count = None, 0
+        doc = first
+        while doc is not None:
+            last, count = doc, count + 1
+            record = {key: doc[key] for key in ("origem", "destino", "veiculo", "data") if key in doc}
+            yield ("," if count > 1 else "") + app.json.dumps(record)
+            doc = next(registros, None)
+        proximo = encode_history_cursor(last) if last is not None and count == limite else None
+        yield '], "proximo": ' + app.json.dumps(proximo) + '}'
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+# Most planned routes and trips per vehicle, computed by MongoDB
+@app.route('/historico/estatisticas', methods=['GET'])
+def estatisticas_historico():
+    historico_collection = mongo.collection("historico")
+    if historico_collection is None:
+        return jsonify({"error": "Não foi possível conectar ao banco de dados MongoDB"}), 500
+    try:
+        top = min(max(int(request.args.get('top', 10)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "Parâmetro 'top' inválido"}), 400
+    try:
+        rotas = historico_collection.aggregate([
+            # Records saved before the normalized fields existed fall back to the raw names
+            {"$group": {
+                "_id": {
+                    "origem": {"$ifNull": ["$origem_normalizada", "$origem"]},
+                    "destino": {"$ifNull": ["$destino_normalizado", "$destino"]},
+                },
+                "origem": {"$first": "$origem"},
+                "destino": {"$first": "$destino"},
+                "viagens": {"$sum": 1},
+            }},
+            {"$sort": {"viagens": -1}},
+            {"$limit": top},
+        ])
+        veiculos = historico_collection.aggregate([
+            {"$group": {"_id": "$veiculo", "viagens": {"$sum": 1}}},
+            {"$sort": {"viagens": -1}},
+        ])
+        return jsonify({
+            "rotas": [
+                {"origem": r["origem"], "destino": r["destino"], "viagens": r["viagens"]}
+                for r in rotas
+            ],
+            "veiculos": [{"veiculo": v["_id"], "viagens": v["viagens"]} for v in veiculos],
+        })
     except Exception as e:
         return jsonify({"error": f"Erro ao acessar o histórico: {str(e)}"}), 500
 
+# Cache counters
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "weather": weather_cache.stats(),
+        "route": route_cache.stats(),
+        "guide": {**guide_cache.stats(), "coalesced": guide_flight.coalesced},
+    })
+
+# Prometheus metrics
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    caches = {"weather": weather_cache, "route": route_cache, "guide": guide_cache}
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    gauges = [
+        ("cache_hit_ratio", "Proporção de acertos por cache",
+         [({"cache": name}, s["hit_ratio"]) for name, s in stats.items()]),
+        ("cache_entries", "Entradas em memória por cache",
+         [({"cache": name}, s["size"]) for name, s in stats.items()]),
+    ]
+    history = history_writer.stats()
+    gauges.append(("history_writer_queued", "Documentos do histórico aguardando escrita", [({}, history.pop("queued"))]))
+    gauges.append(("circuit_open", "Circuito aberto (1) ou não (0) por API",
+                   [({"upstream": name}, int(b.stats()["estado"] != CircuitBreaker.CLOSED))
+                    for name, b in BREAKERS.items()]))
+    gauges.append(("mongo_connected", "Conexão com o MongoDB estabelecida", [({}, int(mongo.connected()))]))
+    counters = [
+        ("cache_evictions_total", "Remoções por limite de tamanho, por cache",
+         [({"cache": name}, s["evictions"]) for name, s in stats.items()]),
+        ("guide_coalesced_requests_total", "Chamadas ao Groq evitadas por coalescência",
+         [({}, guide_flight.coalesced)]),
+        ("history_writer_documents_total", "Documentos do histórico por resultado da escrita",
+         [({"resultado": key}, value) for key, value in history.items()]),
+    ]
+    return Response(metrics.render(gauges, counters), mimetype="text/plain; version=0.0.4")
+
 # favicon
 @app.route('/favicon.ico')
 def favicon():
     return "", 204
 
+# Log and count an unhandled error of the current request
+def record_error(error):
+    metrics.http_errors.inc(endpoint=request.endpoint or "desconhecido", tipo=type(error).__name__)
+    app.logger.error("Erro não tratado em %s", request.path, exc_info=error)
+
 # erros handling
 @app.errorhandler(Exception)
 def handle_error(error):
+    if isinstance(error, HTTPException):
+        return jsonify({"error": error.description}), error.code
+    record_error(error)
     return jsonify({"error": f"Erro interno do servidor: {str(error)}"}), 500
 
 if __name__ == '__main__':
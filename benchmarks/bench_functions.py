@@ -0,0 +1,51 @@
+# Micro-benchmarks for the route/cost functions in app.py
+#
+# Usage: python benchmarks/bench_functions.py [--repeat N] [--saida resultados.jsonl]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+import fake_upstreams  # noqa: E402
+import harness  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+def best_of_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--saida", help="arquivo para acrescentar o resultado (JSON por linha)")
+    args = parser.parse_args()
+
+    app = harness.load_app()
+    weather_reports = [{"city": f"Cidade {i}", "description": "Nublado", "temperature": 25 + i} for i in range(15)]
+
+    resultados = {}
+    print(f"{'vertices':>10} {'extract ms':>11} {'select ms':>10} {'gastos ms':>10}")
+    for size in SIZES:
+        route = fake_upstreams.make_route("São Paulo", "Rio de Janeiro", fake_upstreams.FakeConfig(vertices=size))
+        coordinates = app.extract_route_coordinates(route)
+        tempos = {
+            "extract_route_coordinates": best_of_ms(lambda: app.extract_route_coordinates(route), args.repeat),
+            "select_waypoints": best_of_ms(lambda: app.select_waypoints(coordinates), args.repeat),
+            "calcular_gastos": best_of_ms(lambda: app.calcular_gastos(route, weather_reports, "carro"), args.repeat),
+        }
+        resultados[size] = tempos
+        print(f"{size:>10} {tempos['extract_route_coordinates']:>11} {tempos['select_waypoints']:>10} "
+              f"{tempos['calcular_gastos']:>10}")
+    harness.save_result(args.saida, "bench_functions", {"repeat": args.repeat, "tempos_ms": resultados})
+
+
+if __name__ == "__main__":
+    main()
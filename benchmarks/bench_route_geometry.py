@@ -0,0 +1,84 @@
+# Micro-benchmark: legacy list-based route sampling vs the NumPy route_geometry path
+#
+# Usage: python benchmarks/bench_route_geometry.py [--repeat N]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import polyline
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import route_geometry  # noqa: E402
+
+SIZES = [1_000, 10_000, 50_000, 100_000]
+POINTS_PER_STEP = 200
+
+
+# Synthetic Directions route: a random walk from São Paulo split into steps
+def make_route(n_vertices, seed=0):
+    rng = np.random.default_rng(seed)
+    coords = np.cumsum(rng.normal(0, 0.002, (n_vertices, 2)), axis=0) + [-23.55, -46.63]
+    steps = []
+    for start in range(0, n_vertices, POINTS_PER_STEP):
+        chunk = coords[max(0, start - 1):start + POINTS_PER_STEP]
+        steps.append({
+            "polyline": {"points": polyline.encode([tuple(p) for p in chunk])},
+            "duration": {"value": 60},
+            "distance": {"value": 1000},
+        })
+    return {"legs": [{"steps": steps, "duration": {"value": 60 * len(steps)}, "distance": {"value": 1000 * len(steps)}}]}
+
+
+# The original implementation from app.py
+def legacy_extract(route):
+    coordinates = []
+    for leg in route.get("legs", []):
+        for step in leg.get("steps", []):
+            coordinates.extend(polyline.decode(step["polyline"]["points"]))
+    return coordinates
+
+
+def legacy_select(coordinates, max_points=15):
+    step = max(1, len(coordinates) // max_points)
+    return coordinates[::step]
+
+
+def numpy_pipeline(route):
+    coords, _ = route_geometry.decode_route(route)
+    points = route_geometry.sample_by_distance(coords, 50, 15)
+    return route_geometry.dedupe_cells(points, 0.1)
+
+
+def best_of(func, arg, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'vertices':>10} {'legacy ms':>10} {'numpy ms':>10} {'speedup':>8} {'legacy MB':>10} {'numpy MB':>9}")
+    for size in SIZES:
+        route = make_route(size)
+        legacy = best_of(lambda r: legacy_select(legacy_extract(r)), route, args.repeat)
+        vectorized = best_of(numpy_pipeline, route, args.repeat)
+
+        # Memory held by the decoded coordinates (list of tuples vs float array)
+        coords_list = legacy_extract(route)
+        legacy_mb = (sys.getsizeof(coords_list) + sum(sys.getsizeof(p) + 2 * 24 for p in coords_list)) / 1e6
+        numpy_mb = route_geometry.decode_route(route)[0].nbytes / 1e6
+
+        print(f"{size:>10} {legacy * 1e3:>10.2f} {vectorized * 1e3:>10.2f} {legacy / vectorized:>7.1f}x "
+              f"{legacy_mb:>10.2f} {numpy_mb:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
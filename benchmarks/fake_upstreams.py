@@ -0,0 +1,218 @@
+# Local stand-ins for Google Directions, OpenWeather and Groq, returning the
+# fields app.py parses. Latency, jitter, error rate and route size are configurable.
+#
+# Usage: python benchmarks/fake_upstreams.py --porta 8099 --latencia-ms 80 --erros 0.01
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import polyline
+
+DIRECTIONS_PATH = "/maps/api/directions/json"
+WEATHER_PATH = "/data/2.5/weather"
+GROQ_PATH = "/openai/v1/chat/completions"
+
+GUIDE_TEXT = (
+    "## Guia da Viagem ##\n"
+    "Aproveite a estrada! Leve água, confira o clima das paradas e visite o centro histórico do destino.\n"
+) * 20
+
+
+class FakeConfig:
+    def __init__(self, latencia_ms=50.0, jitter_ms=20.0, erros=0.0, vertices=5000, pontos_por_passo=200,
+                 latencia_llm_ms=None, token_ms=2.0):
+        self.latencia_ms = latencia_ms  # Mean response latency
+        self.jitter_ms = jitter_ms  # Uniform +/- jitter around the mean
+        self.erros = erros  # Fraction of requests answered with HTTP 500
+        self.vertices = vertices  # Polyline vertices per route
+        self.pontos_por_passo = pontos_por_passo
+        self.latencia_llm_ms = latencia_ms * 10 if latencia_llm_ms is None else latencia_llm_ms
+        self.token_ms = token_ms  # Delay between streamed tokens
+
+
+# Deterministic synthetic route for an origin/destination pair
+def make_route(origin, destination, config):
+    seed = zlib.crc32(f"{origin}|{destination}".encode("utf-8"))
+    rng = np.random.default_rng(seed)
+    start = np.array([-23.55, -46.63]) + rng.uniform(-2, 2, 2)
+    coords = np.cumsum(rng.normal(0.0005, 0.002, (config.vertices, 2)), axis=0) + start
+
+    steps = []
+    for index in range(0, config.vertices, config.pontos_por_passo):
+        chunk = coords[max(0, index - 1):index + config.pontos_por_passo]
+        steps.append({
+            "polyline": {"points": polyline.encode([tuple(p) for p in chunk])},
+            "duration": {"value": 300},
+            "distance": {"value": 5000},
+        })
+    distance_km = 5 * len(steps)
+    overview = coords[:: max(1, config.vertices // 500)]
+    return {
+        "overview_polyline": {"points": polyline.encode([tuple(p) for p in overview])},
+        "legs": [{
+            "start_address": origin,
+            "end_address": destination,
+            "distance": {"text": f"{distance_km} km", "value": distance_km * 1000},
+            "duration": {"text": f"{len(steps) * 5} min", "value": len(steps) * 300},
+            "steps": steps,
+        }],
+    }
+
+
+def make_handler(config):
+    route_cache = {}
+    route_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _delay(self, mean_ms):
+            jitter = random.uniform(-config.jitter_ms, config.jitter_ms)
+            time.sleep(max(0.0, mean_ms + jitter) / 1000)
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _fail(self):
+            if random.random() < config.erros:
+                self._send_json(500, {"error": "falha simulada"})
+                return True
+            return False
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            self._delay(config.latencia_ms)
+            if self._fail():
+                return
+
+            if url.path == DIRECTIONS_PATH:
+                key = (params.get("origin", ""), params.get("destination", ""))
+                with route_lock:
+                    route = route_cache.get(key)
+                    if route is None:
+                        route = route_cache[key] = make_route(*key, config)
+                self._send_json(200, {"status": "OK", "routes": [route]})
+            elif url.path == WEATHER_PATH:
+                lat, lon = float(params.get("lat", 0)), float(params.get("lon", 0))
+                self._send_json(200, {
+                    "cod": 200,
+                    "name": f"Cidade {lat:.1f},{lon:.1f}",
+                    "weather": [{"description": random.choice(["céu limpo", "nublado", "chuva leve"])}],
+                    "main": {"temp": round(18 + (abs(lat * lon) % 17), 1)},
+                })
+            else:
+                self._send_json(404, {"error": "não encontrado"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if urlparse(self.path).path != GROQ_PATH:
+                self._send_json(404, {"error": "não encontrado"})
+                return
+            self._delay(config.latencia_llm_ms)
+            if self._fail():
+                return
+
+            if not payload.get("stream"):
+                self._send_json(200, {"choices": [{"message": {"content": GUIDE_TEXT}}]})
+                return
+
+            # Server-sent events, like the real chat-completions streaming mode
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            tokens = [word + " " for word in GUIDE_TEXT.split(" ")]
+            for token in tokens + [None]:
+                if token is None:
+                    line = "data: [DONE]\n\n"
+                else:
+                    line = "data: " + json.dumps({"choices": [{"delta": {"content": token}}]}) + "\n\n"
+                    time.sleep(config.token_ms / 1000)
+                chunk = line.encode("utf-8")
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Clients that give up (timeouts, deadlines) close the socket mid-response
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+# Start the fake server in a background thread; returns (server, base_url)
+def start(config, host="127.0.0.1", port=0):
+    server = FakeServer((host, port), make_handler(config))
+    threading.Thread(target=server.serve_forever, name="fake-upstreams", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+# Environment variables that point app.py at the fake server
+def app_env(base_url):
+    return {
+        "GOOGLE_DIRECTIONS_URL": base_url + DIRECTIONS_PATH,
+        "OPENWEATHER_URL": base_url + WEATHER_PATH,
+        "GROQ_URL": base_url + GROQ_PATH,
+        "GOOGLE_MAPS_API_KEY": "fake",
+        "OPENWEATHER_API_KEY": "fake",
+        "GROQ_API_KEY": "fake",
+    }
+
+
+def add_arguments(parser):
+    parser.add_argument("--latencia-ms", type=float, default=50.0, help="latência média das APIs falsas")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="variação (+/-) da latência")
+    parser.add_argument("--latencia-llm-ms", type=float, default=None, help="latência do Groq (padrão: 10x)")
+    parser.add_argument("--erros", type=float, default=0.0, help="fração de respostas HTTP 500")
+    parser.add_argument("--vertices", type=int, default=5000, help="vértices da polyline de cada rota")
+
+
+def config_from_args(args):
+    return FakeConfig(
+        latencia_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        erros=args.erros,
+        vertices=args.vertices,
+        latencia_llm_ms=args.latencia_llm_ms,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--porta", type=int, default=8099)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start(config_from_args(args), port=args.porta)
+    print(f"APIs falsas em {base_url}. Variáveis para o app.py:")
+    for key, value in app_env(base_url).items():
+        print(f"export {key}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Helpers shared by the benchmarks: import app.py fully offline and record results
+import json
+import os
+import sys
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Import app.py with the given environment and an in-process MongoDB (mongomock)
+def load_app(env=None):
+    import mongomock
+    import pymongo
+
+    os.environ.update(env or {})
+    pymongo.MongoClient = mongomock.MongoClient
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import app
+    app.mongo.wait(10)
+    app.cache_mongo.wait(10)
+    return app
+
+
+def percentiles(values, points=(50, 95, 99)):
+    import numpy as np
+
+    if not len(values):
+        return {f"p{p}": None for p in points}
+    return {f"p{p}": round(float(np.percentile(values, p)), 2) for p in points}
+
+
+# Peak resident memory of this process, in MB
+def peak_rss_mb():
+    import resource
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+# Append one result (JSON line) to a file, to track runs over time
+def save_result(path, name, result):
+    if not path:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"benchmark": name, "data": datetime.now().isoformat(), **result}) + "\n")
@@ -0,0 +1,103 @@
+# Load test for /plan_viagem and /historico against local fake APIs and an
+# in-process MongoDB. Reports p50/p95/p99 latency, requests per second and peak RSS.
+#
+# Usage: python benchmarks/load_test.py --concorrencia 16 --requisicoes 300 --sem-cache
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(__file__))
+import fake_upstreams  # noqa: E402
+import harness  # noqa: E402
+
+CIDADES = [
+    "São Paulo", "Rio de Janeiro", "Belo Horizonte", "Curitiba", "Campinas", "Santos", "Florianópolis",
+    "Porto Alegre", "Vitória", "Goiânia", "Brasília", "Ribeirão Preto", "Sorocaba", "Juiz de Fora",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concorrencia", type=int, default=8, help="requisições simultâneas")
+    parser.add_argument("--requisicoes", type=int, default=200, help="total de requisições")
+    parser.add_argument("--rotas", type=int, default=20, help="pares origem/destino distintos")
+    parser.add_argument("--historico", type=float, default=0.2, help="fração de requisições para /historico")
+    parser.add_argument("--stream", action="store_true", help="usar /plan_viagem/stream")
+    parser.add_argument("--sem-cache", action="store_true", help="desligar os caches de rota, clima e guia")
+    parser.add_argument("--saida", help="arquivo para acrescentar o resultado (JSON por linha)")
+    fake_upstreams.add_arguments(parser)
+    args = parser.parse_args()
+
+    _, base_url = fake_upstreams.start(fake_upstreams.config_from_args(args))
+    env = fake_upstreams.app_env(base_url)
+    if args.sem_cache:
+        env.update({"ROUTE_CACHE_TTL": "0", "WEATHER_CACHE_TTL": "0", "GUIDE_CACHE_TTL": "0"})
+    app = harness.load_app(env)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app_url = f"http://127.0.0.1:{server.server_port}"
+
+    rng = random.Random(42)
+    pares = [tuple(rng.sample(CIDADES, 2)) for _ in range(args.rotas)]
+    plan_path = "/plan_viagem/stream" if args.stream else "/plan_viagem"
+    local = threading.local()
+
+    def one_request(index):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        if rng.random() < args.historico:
+            endpoint = "/historico"
+            response = session.get(app_url + endpoint, timeout=60)
+        else:
+            endpoint = plan_path
+            origem, destino = rng.choice(pares)
+            response = session.post(
+                app_url + endpoint,
+                json={"origem": origem, "destino": destino, "veiculo": rng.choice(["carro", "moto"])},
+                timeout=60
+            )
+        response.content  # Read the whole (possibly streamed) body
+        return endpoint, (time.perf_counter() - start) * 1000, response.ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        results = list(executor.map(one_request, range(args.requisicoes)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    resumo = {
+        "concorrencia": args.concorrencia,
+        "requisicoes": args.requisicoes,
+        "sem_cache": args.sem_cache,
+        "rps": round(len(results) / elapsed, 1),
+        "erros": sum(1 for _, _, ok in results if not ok),
+        "rss_pico_mb": harness.peak_rss_mb(),
+        "endpoints": {},
+    }
+    for endpoint in sorted({endpoint for endpoint, _, _ in results}):
+        latencies = [ms for name, ms, _ in results if name == endpoint]
+        resumo["endpoints"][endpoint] = {"n": len(latencies), **harness.percentiles(latencies)}
+
+    print(f"{resumo['requisicoes']} requisições, concorrência {resumo['concorrencia']}: "
+          f"{resumo['rps']} req/s, {resumo['erros']} erros, RSS pico {resumo['rss_pico_mb']} MB "
+          f"(app + APIs falsas + gerador no mesmo processo)")
+    print(f"{'endpoint':<22} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, stats in resumo["endpoints"].items():
+        print(f"{endpoint:<22} {stats['n']:>5} {stats['p50']:>9} {stats['p95']:>9} {stats['p99']:>9}")
+    harness.save_result(args.saida, "load_test", resumo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+
+
+# In-process LRU cache with TTL and size-bounded eviction
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=600, shared=None, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared  # Optional shared tier (e.g. MongoCacheTier)
+        self.maxbytes = maxbytes  # Optional memory bound, entries measured by sizeof(value)
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_hits = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value, size = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self._bytes -= size
+
+        # Fall back to the shared tier before counting a miss
+        if self.shared is not None:
+            found = self.shared.get(key)
+            if found is not None:
+                value, ttl = found
+                self._store(key, value, ttl)  # Only for what is left of the shared entry's TTL
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl)
+
+    def _store(self, key, value, ttl=None):
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None and self._bytes > self.maxbytes and len(self._data) > 1
+            ):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared cache tier stored in a MongoDB collection, expired by a TTL index on
+# expira_em (created with ensure_index when the database connects).
+# get_collection returns the collection, or None while MongoDB is unavailable.
+# guard() is a context manager entered around each database call (e.g. a
+# circuit breaker and a timeout). Writes are queued and made by a background
+# thread, so requests never wait on them.
+class MongoCacheTier:
+    def __init__(self, get_collection, guard=nullcontext, max_pending=1000):
+        self.get_collection = get_collection
+        self.guard = guard
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped_writes = 0
+
+    @staticmethod
+    def ensure_index(collection):
+        collection.create_index("expira_em", expireAfterSeconds=0)
+
+    # Returns (value, seconds left before it expires), or None
+    def get(self, key):
+        collection = self.get_collection()
+        if collection is None:
+            return None
+        now = datetime.now(timezone.utc)
+        try:
+            with self.guard():
+                doc = collection.find_one({"_id": key, "expira_em": {"$gt": now}})
+        except Exception:
+            return None
+        if not doc:
+            return None
+        expira_em = doc["expira_em"]
+        if expira_em.tzinfo is None:  # pymongo returns naive UTC datetimes by default
+            expira_em = expira_em.replace(tzinfo=timezone.utc)
+        return doc["valor"], (expira_em - now).total_seconds()
+
+    def set(self, key, value, ttl):
+        expira_em = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        try:
+            self._pending.put_nowait((key, value, expira_em))
+        except queue.Full:
+            with self._lock:
+                self.dropped_writes += 1
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cache-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            key, value, expira_em = self._pending.get()
+            try:
+                collection = self.get_collection()
+                if collection is not None:
+                    with self.guard():
+                        collection.replace_one(
+                            {"_id": key}, {"_id": key, "valor": value, "expira_em": expira_em}, upsert=True
+                        )
+            except Exception:
+                pass  # The shared tier is best effort
+            finally:
+                self._pending.task_done()
+
+    # Wait until every queued write has been made (or given up)
+    def flush(self):
+        self._pending.join()
+
+
+# One in-flight call shared by every caller asking for the same key
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError("Tempo esgotado aguardando chamada em andamento")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+# Request coalescing: concurrent calls for the same key wait on the first one
+# instead of each hitting the upstream
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    # Returns (is_leader, call). The leader must call finish() when done.
+    def begin(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return False, call
+            call = self._calls[key] = _Call()
+            return True, call
+
+    def finish(self, key, result=None, error=None):
+        with self._lock:
+            call = self._calls.pop(key, None)
+        if call is not None:
+            call.result = result
+            call.error = error
+            call.done.set()
+
+    def do(self, key, func, timeout=None):
+        leader, call = self.begin(key)
+        if not leader:
+            return call.wait(timeout)
+        try:
+            result = func()
+        except Exception as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result=result)
+        return result
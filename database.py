@@ -0,0 +1,61 @@
+import threading
+
+from pymongo import MongoClient
+
+
+# MongoDB connection made in the background: workers start instantly, and
+# until the database answers every collection() call returns None
+class LazyMongo:
+    def __init__(self, url, db_name, timeout_ms=3000, retry_interval=15.0, socket_timeout_ms=None):
+        self.url = url
+        self.db_name = db_name
+        self.timeout_ms = timeout_ms
+        self.socket_timeout_ms = socket_timeout_ms  # None: no limit on individual operations
+        self.retry_interval = retry_interval
+        self._db = None
+        self._on_connect = []
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Run func(db) once the connection is up (e.g. to create indexes)
+    def on_connect(self, func):
+        self._on_connect.append(func)
+        return func
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._connect_loop, name="mongo-connect", daemon=True)
+            self._thread.start()
+
+    def _connect_loop(self):
+        while not self._stop.is_set():
+            try:
+                client = MongoClient(
+                    self.url, serverSelectionTimeoutMS=self.timeout_ms, socketTimeoutMS=self.socket_timeout_ms
+                )
+                client.server_info()
+                db = client[self.db_name]
+                for func in self._on_connect:
+                    try:
+                        func(db)
+                    except Exception:
+                        pass  # Setup (indexes) is best effort
+                # From here on pymongo reconnects by itself if the server drops
+                self._db = db
+                self._connected.set()
+                return
+            except Exception:
+                self._stop.wait(self.retry_interval)
+
+    def collection(self, name):
+        return self._db[name] if self._db is not None else None
+
+    def connected(self):
+        return self._connected.is_set()
+
+    def wait(self, timeout=None):
+        return self._connected.wait(timeout)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,136 @@
+import atexit
+import queue
+import threading
+from contextlib import nullcontext
+
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+
+
+# Write-behind history logging: trips are queued in memory and written to
+# MongoDB in batches (insert_many) by a background thread, off the request path.
+# get_collection returns the collection, or None while MongoDB is unavailable;
+# documents wait in the queue until it comes back. guard() is a context manager
+# entered around each insert (e.g. a circuit breaker and a timeout).
+class HistoryWriter:
+    def __init__(self, get_collection, max_queue=10000, batch_size=200, interval=2.0, put_timeout=0.05,
+                 guard=nullcontext):
+        self.get_collection = get_collection
+        self.guard = guard
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout  # Backpressure: how long a request may wait for room in the queue
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    # Queue a document; returns False if the queue stayed full (document dropped)
+    def put(self, doc):
+        try:
+            self._queue.put(doc, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.get_collection() is None:
+                self._stop.wait(self.interval)
+                continue
+            batch = self._take_batch(self.interval)
+            if batch and not self._write(batch):
+                self._stop.wait(self.interval)  # Back off before retrying
+        self.flush()
+
+    # Wait up to `timeout` for the first document, then take whatever is queued
+    def _take_batch(self, timeout):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+        except queue.Empty:
+            return batch
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # Insert a batch; returns False if it failed and was queued again for retry
+    def _write(self, batch):
+        collection = self.get_collection()
+        if collection is None:
+            self._requeue(batch)
+            return False
+        try:
+            with self.guard():
+                collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Rejected documents won't succeed on retry; a duplicate _id means
+            # an earlier, interrupted attempt already wrote the document
+            errors = e.details.get("writeErrors", [])
+            rejected = sum(1 for error in errors if error.get("code") != DUPLICATE_KEY)
+            with self._lock:
+                self.written += len(batch) - rejected
+                self.failed += rejected
+            return True
+        except Exception:
+            # Connection blip: keep the documents (insert_many already gave
+            # them an _id, so a retry can't duplicate them)
+            self._requeue(batch)
+            return False
+        with self._lock:
+            self.written += len(batch)
+        return True
+
+    # Put a failed batch back in the queue; what doesn't fit is dropped
+    def _requeue(self, batch):
+        kept = 0
+        for doc in batch:
+            try:
+                self._queue.put_nowait(doc)
+                kept += 1
+            except queue.Full:
+                break
+        with self._lock:
+            self.retried += kept
+            self.dropped += len(batch) - kept
+
+    # Write everything still queued
+    def flush(self):
+        if self.get_collection() is None:
+            return
+        while True:
+            batch = self._take_batch(0)
+            if not batch or not self._write(batch):
+                return
+
+    def close(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "retried": self.retried,
+            }
@@ -0,0 +1,146 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from requests.exceptions import Timeout
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# Prometheus-style counter, one value per label set
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+# Prometheus-style histogram, one set of buckets per label set
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][index] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, entry["buckets"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {entry['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {entry['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {entry['count']}")
+        return lines
+
+
+stage_seconds = Histogram("plan_stage_seconds", "Duração de cada etapa do planejamento de viagem")
+upstream_seconds = Histogram("upstream_request_seconds", "Latência das chamadas às APIs externas")
+upstream_errors = Counter("upstream_errors_total", "Erros nas chamadas às APIs externas")
+request_seconds = Histogram("http_request_seconds", "Duração das requisições HTTP")
+http_errors = Counter("http_errors_total", "Exceções não tratadas por endpoint")
+
+_timings_lock = threading.Lock()
+
+
+# Time one stage of the current request. The duration goes to the stage
+# histogram and, inside a request, to the Server-Timing header. Callers may
+# set info["count"] to report how many operations the stage did.
+@contextmanager
+def stage(name):
+    info = {}
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        if has_request_context():
+            # Worker threads running with the request's context share its g
+            with _timings_lock:
+                timings = g.setdefault("timings", {})
+                duration, count = timings.get(name, (0.0, 0))
+                timings[name] = (duration + elapsed, count + info.get("count", 1))
+
+
+# Time one call to an external API and count its errors and timeouts
+@contextmanager
+def observe_upstream(name):
+    start = time.perf_counter()
+    try:
+        yield
+    except Timeout:
+        upstream_errors.inc(upstream=name, tipo="timeout")
+        raise
+    except Exception:
+        upstream_errors.inc(upstream=name, tipo="erro")
+        raise
+    finally:
+        upstream_seconds.observe(time.perf_counter() - start, upstream=name)
+
+
+# Server-Timing header value for the stages recorded so far in this request
+def server_timing_header():
+    timings = g.get("timings", {})
+    return ", ".join(
+        f'{name};dur={duration * 1000:.1f};desc="{count}x"' for name, (duration, count) in timings.items()
+    )
+
+
+# Stage timings recorded so far in this request, plus the total since `start`
+# (used as the last event of streamed responses)
+def timings_summary(start):
+    timings = g.get("timings", {})
+    return {
+        "etapas": {
+            name: {"ms": round(duration * 1000, 1), "n": count} for name, (duration, count) in timings.items()
+        },
+        "total_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+# Prometheus text format for every metric plus extra gauges and counters
+def render(gauges=(), counters=()):
+    lines = []
+    for metric in (request_seconds, stage_seconds, upstream_seconds, upstream_errors, http_errors):
+        lines.extend(metric.render())
+    # Values kept elsewhere (caches, history writer): (name, help, [(labels, value)])
+    for kind, extra in (("gauge", gauges), ("counter", counters)):
+        for name, help_text, values in extra:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+    return "\n".join(lines) + "\n"
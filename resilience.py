@@ -0,0 +1,113 @@
+import contextvars
+import threading
+import time
+
+from pymongo.errors import ConnectionFailure, PyMongoError
+from requests.exceptions import ConnectionError, HTTPError, RequestException, Timeout
+
+
+# The request ran out of time before this call could be made
+class DeadlineExceeded(Timeout):
+    pass
+
+
+# The provider's circuit is open: fail fast without calling it
+class CircuitOpenError(RequestException):
+    pass
+
+
+# Time budget shared by every upstream call of one request
+class Deadline:
+    def __init__(self, budget):
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    # Timeout for the next call: its own cap, shrunk to what is left of the budget
+    def timeout(self, cap, minimum=0.05):
+        remaining = self.remaining()
+        if remaining < minimum:
+            raise DeadlineExceeded("Prazo da requisição esgotado")
+        return min(cap, remaining)
+
+
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+def upstream_timeout(cap):
+    deadline = current_deadline.get()
+    return deadline.timeout(cap) if deadline is not None else cap
+
+
+# Run tasks in an executor with the caller's context (and so its deadline)
+def submit_in_context(executor, func, *args):
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+def map_in_context(executor, func, iterable):
+    futures = [submit_in_context(executor, func, item) for item in iterable]
+    return [future.result() for future in futures]
+
+
+# Per-provider circuit breaker. After `failure_threshold` consecutive failures
+# calls fail fast for `reset_timeout` seconds; then one probe call is let
+# through (half-open) and its result closes or reopens the circuit.
+class CircuitBreaker:
+    CLOSED = "fechado"
+    OPEN = "aberto"
+    HALF_OPEN = "semiaberto"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._probe_in_flight):
+                raise CircuitOpenError(f"Circuito de {self.name} aberto")
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._probe_in_flight = False
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    # The call ended without telling us anything about the provider
+    def cancel(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {"estado": self.state, "falhas": self.failures}
+
+
+# Whether an exception says the provider itself is unhealthy
+def is_provider_failure(error):
+    if isinstance(error, HTTPError):
+        return error.response is None or error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (Timeout, ConnectionError))
+
+
+# Whether a MongoDB exception says the server is unreachable or too slow
+def is_database_failure(error):
+    return isinstance(error, ConnectionFailure) or (isinstance(error, PyMongoError) and error.timeout)
@@ -0,0 +1,121 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+# Decode a Google encoded polyline into an (n, 2) float array of lat/lon
+def decode_polyline(encoded, precision=5):
+    if not encoded:
+        return np.empty((0, 2), dtype=np.float64)
+
+    chunks = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    # A value ends at the first chunk without the continuation bit (0x20)
+    ends = np.flatnonzero((chunks & 0x20) == 0)
+    if not ends.size:
+        return np.empty((0, 2), dtype=np.float64)
+    chunks = chunks[: ends[-1] + 1]
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    position = np.arange(chunks.size) - np.repeat(starts, ends - starts + 1)
+    shifted = (chunks & 0x1F) << (5 * position)
+    values = np.add.reduceat(shifted, starts)
+
+    # Zigzag decoding, then the deltas are summed back into coordinates
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    deltas = deltas[: deltas.size - deltas.size % 2].reshape(-1, 2)
+    return np.cumsum(deltas, axis=0) / 10 ** precision
+
+
+# Decode every step of a Directions route into one coordinate array, plus the
+# estimated time (seconds from the start) at each vertex
+def decode_route(route):
+    coords_parts = []
+    eta_parts = []
+    elapsed = 0.0
+
+    for leg in route.get("legs", []):
+        steps = leg.get("steps", [])
+        leg_duration = leg.get("duration", {}).get("value")
+        leg_distance = leg.get("distance", {}).get("value")
+
+        for step in steps:
+            coords = decode_polyline(step["polyline"]["points"])
+            if not len(coords):
+                continue
+
+            step_duration = step.get("duration", {}).get("value")
+            if step_duration is None and leg_duration and leg_distance:
+                # No per-step duration: assume the leg's average speed
+                step_duration = leg_duration * step.get("distance", {}).get("value", 0) / leg_distance
+
+            step_km = cumulative_distance_km(coords)
+            if step_km[-1] > 0:
+                fraction = step_km / step_km[-1]
+            else:
+                fraction = np.zeros(len(coords))
+            # Steps share their boundary vertex: keep it once, but only after
+            # measuring the step's progress from it
+            if coords_parts and np.array_equal(coords[0], coords_parts[-1][-1]):
+                coords, fraction = coords[1:], fraction[1:]
+            if len(coords):
+                eta_parts.append(elapsed + (step_duration or 0.0) * fraction)
+                coords_parts.append(coords)
+            elapsed += step_duration or 0.0
+
+    if not coords_parts:
+        return np.empty((0, 2), dtype=np.float64), np.empty(0, dtype=np.float64)
+    return np.concatenate(coords_parts), np.concatenate(eta_parts)
+
+
+# Cumulative haversine distance (km) from the first vertex to each vertex
+def cumulative_distance_km(coords):
+    if len(coords) < 2:
+        return np.zeros(len(coords))
+    lat = np.radians(coords[:, 0])
+    lon = np.radians(coords[:, 1])
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    segment = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    return np.concatenate(([0.0], np.cumsum(segment)))
+
+
+# Indices of the vertices closest to evenly spaced targets along a measure
+# (distance or time), always including the start and the end of the route
+def _sample_along(measure, spacing, max_points):
+    total = measure[-1]
+    if total <= 0 or max_points < 2:
+        return np.array([0])
+    spacing = max(spacing, total / (max_points - 1))
+    targets = np.arange(0.0, total, spacing)[: max_points - 1]
+    targets = np.append(targets, total)
+    indices = np.searchsorted(measure, targets)
+    return np.unique(np.minimum(indices, len(measure) - 1))
+
+
+# Pick waypoints every `spacing_km` kilometres (at most max_points)
+def sample_by_distance(coords, spacing_km, max_points=15):
+    if not len(coords):
+        return coords
+    return coords[_sample_along(cumulative_distance_km(coords), spacing_km, max_points)]
+
+
+# Pick waypoints every `interval_s` seconds of driving (at most max_points)
+def sample_by_eta(coords, eta, interval_s, max_points=15):
+    if not len(coords):
+        return coords
+    return coords[_sample_along(eta, interval_s, max_points)]
+
+
+# Weather grid cell (row, col) of each lat/lon point. floor_divide rounds like
+# Python's //, so points on a cell boundary land in the same cell everywhere.
+def grid_cells(coords, grid_deg):
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    return np.floor_divide(coords + [90.0, 180.0], grid_deg).astype(np.int64)
+
+
+# Drop points that fall in the same weather grid cell, keeping route order
+def dedupe_cells(coords, grid_deg):
+    if not len(coords):
+        return coords
+    _, first = np.unique(grid_cells(coords, grid_deg), axis=0, return_index=True)
+    return coords[np.sort(first)]
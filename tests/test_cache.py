@@ -0,0 +1,197 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from cache import MongoCacheTier, SingleFlight, TTLCache
+
+
+def test_ttl_expires_entries():
+    cache = TTLCache(ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_limit_evicts_oldest_entries():
+    cache = TTLCache(maxbytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.set("c", "xxxx")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 8
+
+
+def test_byte_limit_keeps_single_oversized_entry():
+    cache = TTLCache(maxbytes=2, sizeof=len)
+    cache.set("a", "xxxx")
+    assert cache.get("a") == "xxxx"
+
+
+def test_replacing_entry_updates_bytes():
+    cache = TTLCache(maxbytes=100, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("a", "xx")
+    assert cache.stats()["bytes"] == 2
+
+
+class DictTier:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        found = self.data.get(key)
+        if found is None:
+            return None
+        value, expires_at = found
+        return value, expires_at - time.monotonic()
+
+    def set(self, key, value, ttl):
+        self.data[key] = (value, time.monotonic() + ttl)
+
+
+def test_shared_tier_fills_local_cache():
+    tier = DictTier()
+    TTLCache(shared=tier).set("a", 1)
+    cache = TTLCache(shared=tier)
+    assert cache.get("a") == 1
+    assert cache.get("a") == 1
+    assert cache.stats()["shared_hits"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_shared_hit_keeps_remaining_ttl():
+    tier = DictTier()
+    tier.set("a", 1, 0.05)
+    cache = TTLCache(ttl=600, shared=tier)
+    assert cache.get("a") == 1
+    del tier.data["a"]
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_mongo_tier_returns_remaining_ttl():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.cache
+    tier = MongoCacheTier(lambda: collection)
+    tier.set("a", {"x": 1}, 600)
+    tier.flush()
+    value, ttl = tier.get("a")
+    assert value == {"x": 1}
+    assert 590 < ttl <= 600
+    assert tier.get("b") is None
+
+
+def test_mongo_tier_unavailable():
+    tier = MongoCacheTier(lambda: None)
+    tier.set("a", 1, 600)
+    tier.flush()
+    assert tier.get("a") is None
+
+
+def test_mongo_tier_guard_failure_is_a_miss():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.cache
+    calls = []
+
+    @contextmanager
+    def guard():
+        calls.append(1)
+        raise RuntimeError("circuito aberto")
+        yield
+
+    tier = MongoCacheTier(lambda: collection, guard=guard)
+    tier.set("a", 1, 600)
+    tier.flush()
+    assert tier.get("a") is None
+    assert collection.count_documents({}) == 0
+    assert len(calls) == 2
+
+
+def test_mongo_tier_set_does_not_block():
+    release = threading.Event()
+
+    class SlowCollection:
+        def replace_one(self, *args, **kwargs):
+            release.wait(2)
+
+    tier = MongoCacheTier(lambda: SlowCollection(), max_pending=1)
+    start = time.perf_counter()
+    for index in range(3):
+        tier.set(str(index), index, 600)
+    assert time.perf_counter() - start < 0.5
+    assert tier.dropped_writes >= 1
+    release.set()
+    tier.flush()
+
+
+def start_follower(flight, key, results, timeout=1.0):
+    def follow():
+        try:
+            results.append(flight.do(key, lambda: "seguidor", timeout=timeout))
+        except Exception as e:
+            results.append(e)
+
+    thread = threading.Thread(target=follow)
+    thread.start()
+    return thread
+
+
+def test_followers_share_leader_result():
+    flight = SingleFlight()
+    leader, _ = flight.begin("k")
+    assert leader
+    results = []
+    threads = [start_follower(flight, "k", results) for _ in range(3)]
+    while flight.coalesced < 3:
+        time.sleep(0.001)
+    flight.finish("k", result="lider")
+    for thread in threads:
+        thread.join()
+    assert results == ["lider"] * 3
+
+
+def test_followers_receive_leader_error():
+    flight = SingleFlight()
+    flight.begin("k")
+    results = []
+    thread = start_follower(flight, "k", results)
+    while flight.coalesced < 1:
+        time.sleep(0.001)
+    error = RuntimeError("falhou")
+    flight.finish("k", error=error)
+    thread.join()
+    assert results == [error]
+
+
+def test_follower_times_out_waiting():
+    flight = SingleFlight()
+    flight.begin("k")
+    with pytest.raises(TimeoutError):
+        flight.do("k", lambda: "seguidor", timeout=0.01)
+
+
+def test_leader_error_is_raised_and_key_released():
+    flight = SingleFlight()
+
+    def boom():
+        raise ValueError("falhou")
+
+    with pytest.raises(ValueError):
+        flight.do("k", boom)
+    assert flight.do("k", lambda: 42) == 42
@@ -0,0 +1,91 @@
+import threading
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from history import HistoryWriter
+
+
+class FakeCollection:
+    def __init__(self, failures=0):
+        self.failures = failures  # Number of insert_many calls that fail
+        self.batches = []
+        self.inserted = threading.Event()
+
+    def insert_many(self, docs, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("conexão perdida")
+        self.batches.append(list(docs))
+        self.inserted.set()
+
+
+def test_flush_writes_in_batches():
+    collection = FakeCollection()
+    writer = HistoryWriter(lambda: collection, batch_size=2)
+    for index in range(5):
+        assert writer.put({"n": index})
+    writer.flush()
+    assert [len(batch) for batch in collection.batches] == [2, 2, 1]
+    assert [doc["n"] for batch in collection.batches for doc in batch] == list(range(5))
+    assert writer.stats() == {"queued": 0, "written": 5, "dropped": 0, "failed": 0, "retried": 0}
+
+
+def test_full_queue_drops_documents():
+    writer = HistoryWriter(lambda: None, max_queue=1, put_timeout=0.01)
+    assert writer.put({"n": 1})
+    assert not writer.put({"n": 2})
+    assert writer.stats()["dropped"] == 1
+
+
+def test_documents_wait_while_database_is_unavailable():
+    writer = HistoryWriter(lambda: None)
+    writer.put({"n": 1})
+    writer.flush()
+    assert writer.stats()["queued"] == 1
+
+
+def test_failed_batch_is_kept_for_retry():
+    collection = FakeCollection(failures=1)
+    writer = HistoryWriter(lambda: collection)
+    writer.put({"n": 1})
+    writer.put({"n": 2})
+    writer.flush()
+    assert writer.stats()["queued"] == 2
+    writer.flush()
+    assert [doc["n"] for doc in collection.batches[0]] == [1, 2]
+    assert writer.stats() == {"queued": 0, "written": 2, "dropped": 0, "failed": 0, "retried": 2}
+
+
+def test_retry_drops_only_what_does_not_fit():
+    collection = FakeCollection(failures=1)
+    writer = HistoryWriter(lambda: collection, max_queue=2, put_timeout=0.01)
+    writer.put({"n": 1})
+    writer.put({"n": 2})
+    batch = writer._take_batch(0)
+    writer.put({"n": 3})
+    assert not writer._write(batch)
+    assert writer.stats()["queued"] == 2
+    assert writer.stats()["dropped"] == 1
+
+
+def test_rejected_documents_are_failed_and_duplicates_written():
+    class RejectingCollection:
+        def insert_many(self, docs, ordered=True):
+            raise BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}, {"index": 1, "code": 121}]})
+
+    writer = HistoryWriter(lambda: RejectingCollection())
+    for index in range(3):
+        writer.put({"n": index})
+    writer.flush()
+    assert writer.stats() == {"queued": 0, "written": 2, "dropped": 0, "failed": 1, "retried": 0}
+
+
+def test_background_thread_writes_and_close_flushes():
+    collection = FakeCollection()
+    writer = HistoryWriter(lambda: collection, interval=0.01)
+    writer.start()
+    writer.put({"n": 1})
+    assert collection.inserted.wait(2)
+    writer.put({"n": 2})
+    writer.close()
+    assert writer.stats()["written"] == 2
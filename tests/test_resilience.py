@@ -0,0 +1,86 @@
+import pytest
+from pymongo.errors import AutoReconnect, DuplicateKeyError, NetworkTimeout, OperationFailure, ServerSelectionTimeoutError
+
+from resilience import CircuitBreaker, CircuitOpenError, is_database_failure
+
+
+def expire(breaker):
+    # Pretend reset_timeout has passed since the circuit opened
+    breaker.opened_at -= breaker.reset_timeout + 1
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("teste", failure_threshold=3)
+    fail(breaker, 2)
+    assert breaker.state == CircuitBreaker.CLOSED
+    fail(breaker, 1)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("teste", failure_threshold=3)
+    fail(breaker, 2)
+    breaker.before_call()
+    breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("teste", failure_threshold=1)
+    fail(breaker, 1)
+    expire(breaker)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_success_closes_circuit():
+    breaker = CircuitBreaker("teste", failure_threshold=1)
+    fail(breaker, 1)
+    expire(breaker)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.stats() == {"estado": CircuitBreaker.CLOSED, "falhas": 0}
+    breaker.before_call()
+
+
+def test_probe_failure_reopens_circuit():
+    breaker = CircuitBreaker("teste", failure_threshold=1)
+    fail(breaker, 1)
+    expire(breaker)
+    fail(breaker, 1)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_probe_frees_the_slot():
+    breaker = CircuitBreaker("teste", failure_threshold=1)
+    fail(breaker, 1)
+    expire(breaker)
+    breaker.before_call()
+    breaker.cancel()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+
+
+@pytest.mark.parametrize("error, failure", [
+    (ServerSelectionTimeoutError("sem servidor"), True),
+    (AutoReconnect("conexão perdida"), True),
+    (NetworkTimeout("tempo esgotado"), True),
+    (DuplicateKeyError("duplicado"), False),
+    (OperationFailure("comando inválido"), False),
+    (ValueError("outro erro"), False),
+])
+def test_database_failure_classification(error, failure):
+    assert is_database_failure(error) is failure
@@ -0,0 +1,124 @@
+import numpy as np
+import polyline
+import pytest
+
+import route_geometry
+
+
+@pytest.mark.parametrize("points", [
+    [(-23.55052, -46.63331)],
+    [(-23.55052, -46.63331), (-22.90685, -43.17290), (-19.91668, -43.93449)],
+    [(0.0, 0.0), (0.00001, -0.00001), (89.99999, 179.99999), (-89.99999, -179.99999)],
+])
+def test_decode_matches_polyline_library(points):
+    encoded = polyline.encode(points)
+    np.testing.assert_allclose(route_geometry.decode_polyline(encoded), polyline.decode(encoded))
+
+
+def test_decode_random_walk_matches_polyline_library():
+    rng = np.random.default_rng(0)
+    coords = np.cumsum(rng.normal(0, 0.01, (2000, 2)), axis=0) + (-23.5, -46.6)
+    encoded = polyline.encode([tuple(point) for point in coords])
+    np.testing.assert_allclose(route_geometry.decode_polyline(encoded), polyline.decode(encoded))
+
+
+def test_decode_precision_6():
+    encoded = polyline.encode([(-23.550521, -46.633311), (-22.906851, -43.172901)], 6)
+    np.testing.assert_allclose(route_geometry.decode_polyline(encoded, 6), polyline.decode(encoded, 6))
+
+
+def test_decode_empty():
+    assert route_geometry.decode_polyline("").shape == (0, 2)
+
+
+def straight_line(n=1001, degrees=1.0):
+    # Along the equator: 1 degree of longitude is ~111.2 km
+    return np.column_stack([np.zeros(n), np.linspace(0.0, degrees, n)])
+
+
+def test_cumulative_distance_along_equator():
+    distance = route_geometry.cumulative_distance_km(straight_line())
+    assert distance[0] == 0
+    assert distance[-1] == pytest.approx(111.2, abs=0.1)
+    assert np.all(np.diff(distance) > 0)
+
+
+def test_sample_by_distance_spacing():
+    coords = straight_line()
+    points = route_geometry.sample_by_distance(coords, 10, max_points=20)
+    spacing = np.diff(route_geometry.cumulative_distance_km(np.vstack([coords[:1], points]))[1:])
+    np.testing.assert_array_equal(points[0], coords[0])
+    np.testing.assert_array_equal(points[-1], coords[-1])
+    assert len(points) == 13
+    assert np.allclose(spacing[:-1], 10, atol=0.12)
+    assert spacing[-1] <= 10
+
+
+def test_sample_by_distance_respects_max_points():
+    coords = straight_line()
+    points = route_geometry.sample_by_distance(coords, 1, max_points=5)
+    assert len(points) == 5
+    spacing = np.diff(route_geometry.cumulative_distance_km(points))
+    assert np.allclose(spacing, spacing[0], atol=0.12)
+
+
+def test_sample_by_eta_intervals():
+    coords = straight_line()
+    eta = np.linspace(0.0, 3600.0, len(coords))
+    points = route_geometry.sample_by_eta(coords, eta, 600, max_points=15)
+    indices = [int(np.flatnonzero((coords == point).all(axis=1))[0]) for point in points]
+    np.testing.assert_allclose(eta[indices], [0, 600, 1200, 1800, 2400, 3000, 3600], atol=3.6)
+
+
+def test_sampling_empty_and_zero_length_routes():
+    assert len(route_geometry.sample_by_distance(np.empty((0, 2)), 10)) == 0
+    single = np.array([[-23.5, -46.6], [-23.5, -46.6]])
+    assert len(route_geometry.sample_by_distance(single, 10)) == 1
+
+
+def step(points, duration=None, distance=None):
+    step = {"polyline": {"points": polyline.encode(points)}}
+    if duration is not None:
+        step["duration"] = {"value": duration}
+    if distance is not None:
+        step["distance"] = {"value": distance}
+    return step
+
+
+def test_decode_route_merges_boundary_vertex_and_interpolates_eta():
+    first = [(0.0, 0.0), (0.0, 0.005), (0.0, 0.01)]
+    second = [(0.0, 0.01), (0.0, 0.02)]
+    route = {"legs": [{"steps": [step(first, duration=100), step(second, duration=200)]}]}
+    coords, eta = route_geometry.decode_route(route)
+    np.testing.assert_allclose(coords, first + second[1:])
+    np.testing.assert_allclose(eta, [0, 50, 100, 300], atol=1e-6)
+
+
+def test_decode_route_uses_leg_speed_without_step_duration():
+    first = [(0.0, 0.0), (0.0, 0.01)]
+    second = [(0.0, 0.01), (0.0, 0.03)]
+    leg = {
+        "duration": {"value": 300},
+        "distance": {"value": 3000},
+        "steps": [step(first, distance=1000), step(second, distance=2000)],
+    }
+    _, eta = route_geometry.decode_route({"legs": [leg]})
+    np.testing.assert_allclose(eta, [0, 100, 300], atol=1e-6)
+
+
+def test_decode_route_without_steps():
+    coords, eta = route_geometry.decode_route({"legs": [{"steps": []}]})
+    assert coords.shape == (0, 2)
+    assert eta.shape == (0,)
+
+
+def test_dedupe_cells_keeps_first_point_per_cell_in_order():
+    coords = np.array([[0.01, 0.01], [0.02, 0.02], [0.15, 0.01], [0.03, 0.03], [0.25, 0.01]])
+    np.testing.assert_array_equal(route_geometry.dedupe_cells(coords, 0.1), coords[[0, 2, 4]])
+
+
+def test_grid_cells_match_python_floor_division_on_boundaries():
+    rng = np.random.default_rng(0)
+    coords = np.round(np.column_stack([rng.uniform(-33, 5, 5000), rng.uniform(-73, -34, 5000)]), 1)
+    expected = [(int((lat + 90) // 0.1), int((lon + 180) // 0.1)) for lat, lon in coords]
+    assert [tuple(cell) for cell in route_geometry.grid_cells(coords, 0.1)] == expected